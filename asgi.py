@@ -0,0 +1,3 @@
+from imagine.asgi import create_asgi_app
+
+application = app = create_asgi_app()
\ No newline at end of file
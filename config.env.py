@@ -5,6 +5,7 @@ MONGO_DB=env.get("MONGO_DB")
 MONGO_USER=env.get("MONGO_USER")
 MONGO_PASS=env.get("MONGO_PASS")
 MONGO_SSL=True
+MONGO_MAX_POOL_SIZE=env.get("MONGO_MAX_POOL_SIZE", "100")
 
 MONGO_FRAMES_COLLECTION=env.get("MONGO_FRAMES_COLLECTION")
 MONGO_ESP_COLLECTION=env.get("MONGO_ESP_COLLECTION")
@@ -12,9 +13,13 @@ MONGO_OUTPUT_COLLECTION=env.get("MONGO_OUTPUT_COLLECTION")
 MONGO_COMMAND_COLLECTION=env.get("MONGO_COMMAND_COLLECTION")
 MONGO_BEACON_COLLECTION=env.get("MONGO_BEACON_COLLECTION")
 MONGO_HEARTBEAT_COLLECTION=env.get("MONGO_HEARTBEAT_COLLECTION")
+MONGO_LEASE_COLLECTION=env.get("MONGO_LEASE_COLLECTION", "leases")
 
 TRIANGULATION_ZERO=env.get("TRIANGULATION_ZERO")
 TRIANGULATION_ENV_FACTOR=env.get("TRIANGULATION_ENV_FACTOR")
 TRIANGULATION_ONE_METER_RSSI=env.get("TRIANGULATION_ONE_METER_RSSI")
+TRIANGULATION_ZONE_SIZE=env.get("TRIANGULATION_ZONE_SIZE", "250")
+TRIANGULATION_SHARDED=env.get("TRIANGULATION_SHARDED", "false").lower() == "true"
+TRIANGULATION_BACKGROUND=env.get("TRIANGULATION_BACKGROUND", "false").lower() == "true"
 
 ADMIN_TOKEN=env.get("ADMIN_TOKEN")
\ No newline at end of file
@@ -1,97 +1,102 @@
-from flask import Flask, abort, request
+from flask import Blueprint, Config, Flask, abort, current_app, request
 from flask_cors import CORS
 from flask_httpauth import HTTPTokenAuth
+import logging
 import os
-from pymongo import MongoClient
-from pymongo.collection import Collection
+from imagine.mongo import LazyMongo
 from imagine.utilities import Triangulator
 import time
 import datetime
 import pytz
 from _thread import *
 
-app = Flask(__name__)
+bp = Blueprint("imagine", __name__)
 auth = HTTPTokenAuth(scheme='Bearer')
-CORS(app)
-
-if os.path.exists(os.path.join(os.getcwd(), "config.py")):
-    app.config.from_pyfile(os.path.join(os.getcwd(), "config.py"))
-else:
-    app.config.from_pyfile(os.path.join(os.getcwd(), "config.env.py"))
-
-tokens = {
-    app.config["ADMIN_TOKEN"]: "admin",
-}
-
-mongo = MongoClient(
-    host=f'{app.config["MONGO_HOST"]}/{app.config["MONGO_DB"]}',
-    username=app.config["MONGO_USER"],
-    password=app.config["MONGO_PASS"],
-    tls=app.config["MONGO_SSL"],
-)
-
-frames: Collection = mongo[app.config["MONGO_DB"]][
-    app.config["MONGO_FRAMES_COLLECTION"]
-]
-esps: Collection = mongo[app.config["MONGO_DB"]][
-    app.config["MONGO_ESP_COLLECTION"]
-]
-output: Collection = mongo[app.config["MONGO_DB"]][
-    app.config["MONGO_OUTPUT_COLLECTION"]
-]
-command: Collection = mongo[app.config["MONGO_DB"]][
-    app.config["MONGO_COMMAND_COLLECTION"]
-]
-beacons: Collection = mongo[app.config["MONGO_DB"]][
-    app.config["MONGO_BEACON_COLLECTION"]
-]
-heartbeats: Collection = mongo[app.config["MONGO_DB"]][
-    app.config["MONGO_HEARTBEAT_COLLECTION"]
-]
-
-triangulator = Triangulator(
-    app.config["TRIANGULATION_ENV_FACTOR"],
-    app.config["TRIANGULATION_ONE_METER_RSSI"],
-    [float(i) for i in app.config["TRIANGULATION_ZERO"].split(",")],
-    mongo_client=mongo,
-    mongo_database=app.config["MONGO_DB"],
-    mongo_frames_collection=app.config["MONGO_FRAMES_COLLECTION"],
-    mongo_esp_collection=app.config["MONGO_ESP_COLLECTION"],
-    mongo_output_collection=app.config["MONGO_OUTPUT_COLLECTION"]
-)
-
-_ovr = os.environ.get("TRIANGULATION_TIMESTAMP_OVERRIDE", default="no")
-TIME_OVERRIDE: float = float(_ovr) if _ovr != "no" else False
+
+
+def load_config(config: Config = None, overrides: dict = None) -> Config:
+    ''' Fill config (an app's, or a new one for scripts) from config.py,
+        or config.env.py if there is none, then apply overrides.
+    '''
+    if config is None:
+        config = Config(os.getcwd())
+    if os.path.exists(os.path.join(os.getcwd(), "config.py")):
+        config.from_pyfile(os.path.join(os.getcwd(), "config.py"))
+    else:
+        config.from_pyfile(os.path.join(os.getcwd(), "config.env.py"))
+    if overrides:
+        config.update(overrides)
+    return config
+
+
+def create_app(config: dict = None) -> Flask:
+    ''' Build the app without touching the database.
+        Mongo clients are opened per process on first use, and the
+        background triangulation loop only runs when TRIANGULATION_BACKGROUND
+        is set. Values in config override config.py / config.env.py.
+    '''
+    app = Flask(__name__)
+    CORS(app)
+    load_config(app.config, config)
+
+    mongo = LazyMongo(app.config)
+    triangulator = Triangulator(
+        float(app.config["TRIANGULATION_ENV_FACTOR"]),
+        float(app.config["TRIANGULATION_ONE_METER_RSSI"]),
+        [float(i) for i in app.config["TRIANGULATION_ZERO"].split(",")],
+        mongo_client=mongo,
+        mongo_database=app.config["MONGO_DB"],
+        mongo_frames_collection=app.config["MONGO_FRAMES_COLLECTION"],
+        mongo_esp_collection=app.config["MONGO_ESP_COLLECTION"],
+        mongo_output_collection=app.config["MONGO_OUTPUT_COLLECTION"]
+    )
+    app.extensions["mongo"] = mongo
+    app.extensions["triangulator"] = triangulator
+    app.register_blueprint(bp)
+
+    # Sharded deployments leave triangulation to worker.py processes
+    if app.config.get("TRIANGULATION_BACKGROUND") and not app.config.get("TRIANGULATION_SHARDED"):
+        start_new_thread(update_constant, (triangulator,))
+
+    return app
+
+def _collection(key):
+    return current_app.extensions["mongo"].collection(key)
+
+def check_token(config, token):
+    if token == config["ADMIN_TOKEN"]:
+        return "admin"
 
 @auth.verify_token
 def verify_token(token):
-    if token in tokens:
-        return tokens[token]
+    return check_token(current_app.config, token)
 
-@app.route('/beacons/locations', methods=['GET'])
+@bp.route('/beacons/locations', methods=['GET'])
 def locations():
-    res = output.find()
+    res = _collection("MONGO_OUTPUT_COLLECTION").find()
     out = {}
     for i in res:
         beacon_id = i["beacon_id"]
-        beacon_find = beacons.find({"id": beacon_id})
-        beacon_hidden = True
-        for bool in beacon_find:
-            if not bool["hidden"]:
-                beacon_hidden = False
-                break
-        if not beacon_hidden:
+        beacon_find = _collection("MONGO_BEACON_COLLECTION").find({"id": beacon_id})
+        if beacon_id in visible_beacons(beacon_find):
             out[beacon_id] = {k: v for k, v in i.items() if not k in ["_id", "testpos"]}
     return out
 
-@app.route('/beacons/heartbeat', methods=['GET'])
+def visible_beacons(res):
+    # A beacon is shown if any of its docs isn't hidden
+    return {i["id"] for i in res if not i["hidden"]}
+
+@bp.route('/beacons/heartbeat', methods=['GET'])
 def get_heartbeats():
     args = request.args
     id = args.get("id")
     if id:
-        res = heartbeats.find({"sniffaddr": id})
+        res = _collection("MONGO_HEARTBEAT_COLLECTION").find({"sniffaddr": id})
     else:
-        res = heartbeats.find()
+        res = _collection("MONGO_HEARTBEAT_COLLECTION").find()
+    return format_heartbeats(res)
+
+def format_heartbeats(res):
     out = {}
     for i in res:
         addr = i["sniffaddr"]
@@ -105,51 +110,55 @@ def get_heartbeats():
         out[key] = timestamp.strftime("%m/%d/%Y %H:%M:%S")
     return out
 
-# @app.route("/config/zero", methods=['GET'])
+# @bp.route("/config/zero", methods=['GET'])
 # def get_zero():
 #     return triangulator.zero_zero
 
-@app.route("/esp", methods=['POST'])
+@bp.route("/esp", methods=['POST'])
 @auth.login_required
 def new_esp():
     args = request.args
     id = args.get("id")
     lat = args.get("lat")
     lon = args.get("lon")
+    zone = args.get("zone")
     if not (id and lat and lon):
         abort(400)
-    triangulator.add_esp([float(lat), float(lon)], id)
+    current_app.extensions["triangulator"].add_esp([float(lat), float(lon)], id, zone=zone)
     return "OK", 200
 
-@app.route("/remove/esp", methods=['POST'])
+@bp.route("/remove/esp", methods=['POST'])
 @auth.login_required
 def remove_esp():
     args = request.args
     id = args.get("id")
-    result = triangulator.remove_esp(id)
+    result = current_app.extensions["triangulator"].remove_esp(id)
     if result:
         return "OK", 200
     return "ESP Not Found", 400
 
-@app.route("/hide", methods=['POST'])
+@bp.route("/hide", methods=['POST'])
 @auth.login_required
 def hide_beacon():
     args = request.args
     id = args.get("id")
-    beacons.update_one({"id": id}, {"$set": {"hidden": True}})
+    _collection("MONGO_BEACON_COLLECTION").update_one({"id": id}, {"$set": {"hidden": True}})
     return "OK", 200
 
-@app.route("/unhide", methods=['POST'])
+@bp.route("/unhide", methods=['POST'])
 @auth.login_required
 def unhide_beacon():
     args = request.args
     id = args.get("id")
-    beacons.update_one({"id": id}, {"$set": {"hidden": False}})
+    _collection("MONGO_BEACON_COLLECTION").update_one({"id": id}, {"$set": {"hidden": False}})
     return "OK", 200
 
-def update_constant():
+def update_constant(triangulator):
+    _ovr = os.environ.get("TRIANGULATION_TIMESTAMP_OVERRIDE", default="no")
+    time_override = float(_ovr) if _ovr != "no" else False
     while True:
-        triangulator.run_once(TIME_OVERRIDE if TIME_OVERRIDE else (time.time() - 2.5), bounds=2.5)
+        try:
+            triangulator.run_once(time_override if time_override else (time.time() - 2.5), bounds=2.5)
+        except:
+            logging.exception("Error in triangulation")
         time.sleep(5)
-
-start_new_thread(update_constant, ())
\ No newline at end of file
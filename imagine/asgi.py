@@ -0,0 +1,120 @@
+from functools import wraps
+from quart import Quart, Response, abort, current_app, request
+from quart_cors import cors
+from imagine import auth, check_token, format_heartbeats, load_config, visible_beacons
+from imagine.mongo import AsyncMongo
+from imagine.utilities import esp_document
+
+
+def create_asgi_app(config: dict = None) -> Quart:
+    ''' Async app serving the read and admin endpoints over ASGI.
+        Requests share one pooled async Mongo client per process instead of
+        blocking a worker thread each. Triangulation is left to the WSGI
+        app's background loop or worker.py.
+    '''
+    app = cors(Quart(__name__))
+    load_config(app.config, config)
+
+    mongo = AsyncMongo(app.config)
+    app.extensions["mongo"] = mongo
+    app.before_serving(mongo.connect)
+    app.after_serving(mongo.close)
+
+    app.add_url_rule("/beacons/locations", view_func=locations, methods=["GET"])
+    app.add_url_rule("/beacons/heartbeat", view_func=get_heartbeats, methods=["GET"])
+    app.add_url_rule("/esp", view_func=new_esp, methods=["POST"])
+    app.add_url_rule("/remove/esp", view_func=remove_esp, methods=["POST"])
+    app.add_url_rule("/hide", view_func=hide_beacon, methods=["POST"])
+    app.add_url_rule("/unhide", view_func=unhide_beacon, methods=["POST"])
+    return app
+
+
+def _collection(key):
+    return current_app.extensions["mongo"].collection(key)
+
+
+def login_required(view):
+    # Same token check and 401 response as the sync app's HTTPTokenAuth
+    @wraps(view)
+    async def wrapper(*args, **kwargs):
+        scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+        if scheme.lower() != auth.scheme.lower() or not check_token(
+            current_app.config, token.strip()
+        ):
+            return Response(
+                "Unauthorized Access",
+                401,
+                {"WWW-Authenticate": auth.authenticate_header()},
+            )
+        return await view(*args, **kwargs)
+
+    return wrapper
+
+
+async def locations():
+    res = await _collection("MONGO_OUTPUT_COLLECTION").find().to_list(None)
+    # One query for every beacon's hidden flag rather than one per beacon
+    visible = visible_beacons(
+        await _collection("MONGO_BEACON_COLLECTION")
+        .find({"id": {"$in": [i["beacon_id"] for i in res]}}, {"id": 1, "hidden": 1})
+        .to_list(None)
+    )
+    return {
+        i["beacon_id"]: {k: v for k, v in i.items() if not k in ["_id", "testpos"]}
+        for i in res
+        if i["beacon_id"] in visible
+    }
+
+
+async def get_heartbeats():
+    id = request.args.get("id")
+    pipeline = [
+        {"$match": {"sniffaddr": id} if id else {}},
+        {"$group": {"_id": "$sniffaddr", "timestamp": {"$max": "$timestamp"}}},
+    ]
+    res = _collection("MONGO_HEARTBEAT_COLLECTION").aggregate(pipeline)
+    return format_heartbeats(
+        [{"sniffaddr": i["_id"], "timestamp": i["timestamp"]} async for i in res]
+    )
+
+
+@login_required
+async def new_esp():
+    args = request.args
+    id = args.get("id")
+    lat = args.get("lat")
+    lon = args.get("lon")
+    zone = args.get("zone")
+    if not (id and lat and lon):
+        abort(400)
+    await _collection("MONGO_ESP_COLLECTION").insert_one(
+        esp_document([float(lat), float(lon)], id, zone)
+    )
+    return "OK", 200
+
+
+@login_required
+async def remove_esp():
+    id = request.args.get("id")
+    result = await _collection("MONGO_ESP_COLLECTION").delete_one({"id": id})
+    if result.deleted_count == 1:
+        return "OK", 200
+    return "ESP Not Found", 400
+
+
+@login_required
+async def hide_beacon():
+    id = request.args.get("id")
+    await _collection("MONGO_BEACON_COLLECTION").update_one(
+        {"id": id}, {"$set": {"hidden": True}}
+    )
+    return "OK", 200
+
+
+@login_required
+async def unhide_beacon():
+    id = request.args.get("id")
+    await _collection("MONGO_BEACON_COLLECTION").update_one(
+        {"id": id}, {"$set": {"hidden": False}}
+    )
+    return "OK", 200
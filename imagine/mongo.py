@@ -0,0 +1,69 @@
+from pymongo.collection import Collection
+from imagine.utilities import get_async_mongo_client, get_mongo_client
+import os
+import threading
+
+
+class LazyMongo:
+    ''' Mongo client opened on first use, once per process.
+        MongoClient is not fork-safe, so a forked WSGI worker opens its own
+        client instead of inheriting the parent's.
+    '''
+
+    def __init__(self, config):
+        self.config = config
+        self._client = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._client = get_mongo_client(
+                        self.config["MONGO_HOST"],
+                        self.config["MONGO_DB"],
+                        self.config["MONGO_USER"],
+                        self.config["MONGO_PASS"],
+                        self.config["MONGO_SSL"],
+                    )
+                    self._pid = os.getpid()
+        return self._client
+
+    def __getitem__(self, database: str):
+        # Lets a LazyMongo stand in for a MongoClient
+        return self.client[database]
+
+    def collection(self, key: str) -> Collection:
+        ''' Collection named by config key, e.g. "MONGO_ESP_COLLECTION" '''
+        return self.client[self.config["MONGO_DB"]][self.config[key]]
+
+
+class AsyncMongo:
+    ''' Pooled async Mongo client for the ASGI app.
+        Opened by connect() once the server's event loop is running.
+    '''
+
+    def __init__(self, config):
+        self.config = config
+        self.client = None
+
+    def connect(self):
+        self.client = get_async_mongo_client(
+            self.config["MONGO_HOST"],
+            self.config["MONGO_DB"],
+            self.config["MONGO_USER"],
+            self.config["MONGO_PASS"],
+            self.config["MONGO_SSL"],
+            int(self.config.get("MONGO_MAX_POOL_SIZE", 100)),
+        )
+
+    def close(self):
+        if self.client is not None:
+            self.client.close()
+            self.client = None
+
+    def collection(self, key: str):
+        ''' Collection named by config key, e.g. "MONGO_ESP_COLLECTION" '''
+        return self.client[self.config["MONGO_DB"]][self.config[key]]
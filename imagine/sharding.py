@@ -0,0 +1,206 @@
+from datetime import timezone
+from pymongo.collection import Collection
+from pymongo.database import Database
+from pymongo.errors import DuplicateKeyError
+from imagine.utilities import Triangulator, meters_per_degree
+import math
+import time
+import zlib
+
+
+def server_time(database: Database) -> float:
+    ''' Unix time on the Mongo server.
+        Workers on different nodes use it for lease expiry and the
+        triangulation window, so local clock skew can't make them disagree.
+    '''
+    try:
+        local_time = database.command("hello")["localTime"]
+    except NotImplementedError:  # mongomock, which only lives in this process
+        return time.time()
+    return local_time.replace(tzinfo=timezone.utc).timestamp()
+
+
+class Zone:
+    def __init__(self, id: str, origin: list[float], esps: set[str]):
+        self.id = id
+        self.origin = origin  # lat/lon position of the zone's local (0, 0)
+        self.esps = esps  # IDs of the ESPs in this zone
+
+    def __eq__(self, other):
+        return (
+            isinstance(other, Zone)
+            and self.id == other.id
+            and self.origin == other.origin
+            and self.esps == other.esps
+        )
+
+
+class ZoneMap:
+    ''' Partition of the ESP registry into zones.
+        ESPs with a "zone" field are placed in that zone, with the south-west
+        corner of its ESPs as the origin. All other ESPs are placed on a grid
+        of zone_size meter cells laid out from zero_zero.
+    '''
+
+    def __init__(self, esp_docs, zero_zero: list[float], zone_size: float):
+        self.zero_zero = zero_zero
+        self.lat_con, self.lon_con = meters_per_degree(zero_zero)
+
+        self.positions = {}  # ESP id -> lat/lon
+        self.esp_zone = {}  # ESP id -> zone id
+        members = {}
+        origins = {}
+        for doc in esp_docs:
+            esp_id, pos = doc["id"], doc["position"]
+            self.positions[esp_id] = pos
+            if doc.get("zone"):
+                zone_id = str(doc["zone"])
+                origin = origins.get(zone_id, pos)
+                origins[zone_id] = [min(origin[0], pos[0]), min(origin[1], pos[1])]
+            else:
+                x, y = self.normalize(*pos)
+                row, col = math.floor(x / zone_size), math.floor(y / zone_size)
+                zone_id = f"{row},{col}"
+                origins[zone_id] = [
+                    zero_zero[0] + row * zone_size / self.lat_con,
+                    zero_zero[1] + col * zone_size / self.lon_con,
+                ]
+            self.esp_zone[esp_id] = zone_id
+            members.setdefault(zone_id, set()).add(esp_id)
+
+        self.zones = {z: Zone(z, origins[z], esps) for z, esps in members.items()}
+
+    def normalize(self, lat: float, lon: float) -> tuple[float, float]:
+        return (lat - self.zero_zero[0]) * self.lat_con, (
+            lon - self.zero_zero[1]
+        ) * self.lon_con
+
+    def owner(self, esps: dict) -> str:
+        ''' Zone responsible for a beacon heard by several ESPs.
+            The zone of the ESP with the strongest RSSI wins, ties going to
+            the lowest zone id, so every worker hands a boundary beacon to
+            the same zone.
+        '''
+        return min((-e["rssi"], self.esp_zone[i]) for i, e in esps.items())[1]
+
+
+class ZoneLeases:
+    ''' Zone ownership through expiring leases in a shared collection.
+        Each worker keeps a presence document alive and holds at most an
+        even share of the zones, so zones move to new workers as they join
+        and are picked up again when a worker stops renewing. Pass now from
+        server_time so every node compares expiry against the same clock.
+    '''
+
+    def __init__(self, collection: Collection, worker_id: str, ttl: float):
+        self.collection = collection
+        self.worker_id = worker_id
+        self.ttl = ttl
+
+    def heartbeat(self, now: float):
+        self.collection.replace_one(
+            {"_id": f"worker:{self.worker_id}"},
+            {"expires": now + self.ttl},
+            upsert=True,
+        )
+
+    def live_workers(self, now: float) -> int:
+        return self.collection.count_documents(
+            {"_id": {"$regex": "^worker:"}, "expires": {"$gt": now}}
+        )
+
+    def claim(self, zone_id: str, now: float) -> bool:
+        try:
+            self.collection.update_one(
+                {
+                    "_id": f"zone:{zone_id}",
+                    "$or": [{"holder": self.worker_id}, {"expires": {"$lt": now}}],
+                },
+                {"$set": {"holder": self.worker_id, "expires": now + self.ttl}},
+                upsert=True,
+            )
+        except DuplicateKeyError:  # Held by another worker
+            return False
+        return True
+
+    def release(self, zone_id: str):
+        self.collection.delete_one(
+            {"_id": f"zone:{zone_id}", "holder": self.worker_id}
+        )
+
+    def rebalance(self, zone_ids, now: float) -> list[str]:
+        self.heartbeat(now)
+        share = math.ceil(len(zone_ids) / max(self.live_workers(now), 1))
+        held = {
+            d["_id"][len("zone:") :]
+            for d in self.collection.find(
+                {"_id": {"$regex": "^zone:"}, "holder": self.worker_id}
+            )
+        }
+
+        claimed = []
+        # Per-worker preference order keeps workers from all racing for the same zones
+        for zone_id in sorted(
+            zone_ids,
+            key=lambda z: (z not in held, zlib.crc32(f"{self.worker_id}:{z}".encode())),
+        ):
+            if len(claimed) < share and self.claim(zone_id, now):
+                claimed.append(zone_id)
+            elif zone_id in held:
+                self.release(zone_id)
+        for zone_id in held - set(zone_ids):  # Zone no longer exists
+            self.release(zone_id)
+        return claimed
+
+
+class ZoneTriangulator(Triangulator):
+    ''' Triangulator for the beacons owned by one zone.
+        Positions are solved around the zone's local origin and reported
+        relative to the venue-wide zero_zero of the zone map.
+    '''
+
+    def __init__(
+        self,
+        zone: Zone,
+        zone_map: ZoneMap,
+        environmental_value: float,
+        one_meter_rssi: float,
+        **kwargs,
+    ):
+        super().__init__(
+            environmental_value,
+            one_meter_rssi,
+            zone.origin,
+            esps=zone_map.positions,
+            **kwargs,
+        )
+        self.zone = zone
+        self.zone_map = zone_map
+
+    def _find_frames(self, timestamp, bounds):
+        window = {"$lt": timestamp + bounds, "$gt": timestamp - bounds}
+        # Beacons heard in this zone, with every frame for them including other zones'
+        heard = self.frames_collection.distinct(
+            "macaddr", {"timestamp": window, "sniffaddr": {"$in": list(self.zone.esps)}}
+        )
+        return self.frames_collection.find(
+            filter={"timestamp": window, "macaddr": {"$in": heard}}
+        )
+
+    def _get_findable_beacons(self, timestamp, bounds):
+        return {
+            b: v
+            for b, v in super()._get_findable_beacons(timestamp, bounds).items()
+            if self.zone_map.owner(v["esps"]) == self.zone.id
+        }
+
+    def aggregate(self, timestamp: float, bounds: float = 5):
+        beacons = super().aggregate(timestamp, bounds=bounds)
+        for doc in beacons.values():
+            doc["zone"] = self.zone.id
+            doc["position"] = self.zone_map.normalize(*doc["absolute_position"])
+            for esp in doc["esps"].values():
+                esp["esp_position_normal"] = self.zone_map.normalize(
+                    *esp["esp_position"]
+                )
+        return beacons
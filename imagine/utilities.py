@@ -1,10 +1,81 @@
 from pymongo import MongoClient
 from geopy.distance import geodesic
+from functools import cached_property
 from imagine.triangulator import geo_triangulate, LatLong
 import math
 import logging
 
 
+def get_mongo_client(
+    host: str,
+    database: str,
+    username: str = None,
+    password: str = None,
+    tls: bool = True,
+) -> MongoClient:
+    # mongomock:// gives an in-memory stand-in for running locally without a server
+    if host.startswith("mongomock://"):
+        import mongomock
+
+        return mongomock.MongoClient()
+    return MongoClient(
+        host=host + "/" + database,
+        username=username,
+        password=password,
+        tls=tls,
+    )
+
+
+def get_async_mongo_client(
+    host: str,
+    database: str,
+    username: str = None,
+    password: str = None,
+    tls: bool = True,
+    max_pool_size: int = 100,
+):
+    # Must be called with the event loop running
+    if host.startswith("mongomock://"):
+        from mongomock_motor import AsyncMongoMockClient
+
+        return AsyncMongoMockClient()
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    return AsyncIOMotorClient(
+        host=host + "/" + database,
+        username=username,
+        password=password,
+        tls=tls,
+        maxPoolSize=max_pool_size,
+    )
+
+
+def esp_document(pos: list[float], id: str, zone: str = None) -> dict:
+    doc = {"id": id, "position": pos}
+    if zone:
+        doc["zone"] = zone
+    return doc
+
+
+def meters_per_degree(zero_zero: list[float]) -> tuple[float, float]:
+    # Meters per degree of latitude and longitude around zero_zero
+    lat_con = geodesic(
+        zero_zero,
+        [
+            (zero_zero[0] + 1 if zero_zero[0] < 89 else zero_zero[0] - 1),
+            zero_zero[1],
+        ],
+    ).meters
+    lon_con = geodesic(
+        zero_zero,
+        [
+            zero_zero[0],
+            (zero_zero[1] + 1 if zero_zero[1] < 89 else zero_zero[1] - 1),
+        ],
+    ).meters
+    return lat_con, lon_con
+
+
 class Triangulator:
     def __init__(
         self,
@@ -21,47 +92,75 @@ class Triangulator:
         mongo_esp_collection: str = "esps",  # ESP position collection name
         mongo_output_collection: str = "positions",  # Collection to output to
         test: bool = False,
+        esps: dict = None,  # Preloaded {id: position} of ESPs, skips reading the ESP collection
     ):
         self.N = environmental_value
         self.MEASURED_VALUE = one_meter_rssi
         self.zero_zero = zero_zero
 
-        if mongo_client:
-            self.client = mongo_client
-        else:
-            self.client = MongoClient(
-                host=mongo_host + "/" + mongo_database,
-                username=mongo_user,
-                password=mongo_password,
-                tls=mongo_ssl,
-            )
-        self.database = self.client[mongo_database]
-
-        self.frames_collection = self.database[mongo_frames_collection]
-        self.esp_collection = self.database[mongo_esp_collection]
-        self.output_collection = self.database[mongo_output_collection]
-
-        self.esps = {
-            i["id"]: i["position"] for i in self.esp_collection.find(filter={})
-        }
-
-        self.lat_con = geodesic(
-            zero_zero,
-            [
-                (zero_zero[0] + 1 if zero_zero[0] < 89 else zero_zero[0] - 1),
-                zero_zero[1],
-            ],
-        ).meters
-        self.lon_con = geodesic(
-            zero_zero,
-            [
-                zero_zero[0],
-                (zero_zero[1] + 1 if zero_zero[1] < 89 else zero_zero[1] - 1),
-            ],
-        ).meters
+        # Nothing below touches the database or geodesics until first used
+        self._client = mongo_client
+        self._mongo_args = (
+            mongo_host, mongo_database, mongo_user, mongo_password, mongo_ssl
+        )
+        self._mongo_database = mongo_database
+        self._mongo_frames_collection = mongo_frames_collection
+        self._mongo_esp_collection = mongo_esp_collection
+        self._mongo_output_collection = mongo_output_collection
+
+        self._esps = esps
+        # ESPs are added and removed by other processes, so a map read from
+        # the collection is re-read every run. A preloaded map is kept as is.
+        self._reload_esps = esps is None
 
         self.test = test
 
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = get_mongo_client(*self._mongo_args)
+        return self._client
+
+    @property
+    def database(self):
+        return self.client[self._mongo_database]
+
+    @property
+    def frames_collection(self):
+        return self.database[self._mongo_frames_collection]
+
+    @property
+    def esp_collection(self):
+        return self.database[self._mongo_esp_collection]
+
+    @property
+    def output_collection(self):
+        return self.database[self._mongo_output_collection]
+
+    @property
+    def esps(self) -> dict:
+        if self._esps is None:
+            self._esps = {
+                i["id"]: i["position"] for i in self.esp_collection.find(filter={})
+            }
+        return self._esps
+
+    @esps.setter
+    def esps(self, esps: dict):
+        self._esps = esps
+
+    @cached_property
+    def _cons(self) -> tuple[float, float]:
+        return meters_per_degree(self.zero_zero)
+
+    @property
+    def lat_con(self) -> float:
+        return self._cons[0]
+
+    @property
+    def lon_con(self) -> float:
+        return self._cons[1]
+
     def _calc_distance(self, rssi):
         return 10 ** ((self.MEASURED_VALUE - rssi) / (10 * self.N))
 
@@ -73,11 +172,18 @@ class Triangulator:
     def _get_unnormalized_point(self, lat: float, lon: float) -> list[float]:
         return lat / self.lat_con + self.zero_zero[0], lon / self.lon_con + self.zero_zero[1]
 
+    def _find_frames(self, timestamp, bounds):
+        return self.frames_collection.find(
+            filter={"timestamp": {"$lt": timestamp + bounds, "$gt": timestamp - bounds}}
+        )
+
     def _get_findable_beacons(self, timestamp, bounds):
+        if self._reload_esps:
+            self._esps = None
         beacons = {}
-        for frame in self.frames_collection.find(
-            filter={"timestamp": {"$lt": timestamp + bounds, "$gt": timestamp - bounds}}
-        ):
+        for frame in self._find_frames(timestamp, bounds):
+            if not frame["sniffaddr"] in self.esps:  # Unregistered sniffer
+                continue
             if not frame["macaddr"] in beacons.keys():
                 beacons[frame["macaddr"]] = {
                     "position": None,
@@ -167,12 +273,15 @@ class Triangulator:
     def aggregate(self, timestamp: float, bounds: float = 5):
         findable_beacons = self._get_findable_beacons(timestamp, bounds)
 
+        located = {}
         for b in findable_beacons.keys():
-            findable_beacons[b]["position"], findable_beacons[b]["absolute_position"] = self._calc_position(
-                findable_beacons[b], 2.5
-            )
+            position = self._calc_position(findable_beacons[b], 2.5)
+            if position is None:  # ESP ranges don't intersect, nothing to report
+                continue
+            findable_beacons[b]["position"], findable_beacons[b]["absolute_position"] = position
+            located[b] = findable_beacons[b]
 
-        return findable_beacons
+        return located
     
     def run_once(self, timestamp: float, bounds: float = 5):
         beacons = self.aggregate(timestamp, bounds=bounds)
@@ -186,9 +295,13 @@ class Triangulator:
                 return False
         return True
     
-    def add_esp(self, pos, id):
-        self.esp_collection.insert_one({"id": id, "position": pos})
-        
+    def add_esp(self, pos, id, zone=None):
+        self.esp_collection.insert_one(esp_document(pos, id, zone))
+        if self._esps is not None:
+            self._esps[id] = pos
+
     def remove_esp(self, id):
         result = self.esp_collection.delete_one({"id": id})
+        if self._esps is not None:
+            self._esps.pop(id, None)
         return result.deleted_count == 1
\ No newline at end of file
@@ -0,0 +1,101 @@
+import argparse
+import asyncio
+import random
+import time
+import aiohttp
+from imagine import load_config
+from imagine.utilities import get_mongo_client
+
+
+def seed(config, beacons: int, sniffers: int):
+    ''' Fill the configured database with fake positions and heartbeats '''
+    mongo = get_mongo_client(
+        config["MONGO_HOST"],
+        config["MONGO_DB"],
+        config["MONGO_USER"],
+        config["MONGO_PASS"],
+        config["MONGO_SSL"],
+    )
+    db = mongo[config["MONGO_DB"]]
+    now = time.time()
+    db[config["MONGO_OUTPUT_COLLECTION"]].delete_many({})
+    db[config["MONGO_BEACON_COLLECTION"]].delete_many({})
+    db[config["MONGO_HEARTBEAT_COLLECTION"]].delete_many({})
+    db[config["MONGO_OUTPUT_COLLECTION"]].insert_many(
+        {
+            "beacon_id": f"beacon{b}",
+            "position": [random.uniform(0, 100), random.uniform(0, 100)],
+            "absolute_position": [43.08 + random.uniform(0, 1e-3), -77.67],
+            "esps": {},
+        }
+        for b in range(beacons)
+    )
+    db[config["MONGO_BEACON_COLLECTION"]].insert_many(
+        {"id": f"beacon{b}", "hidden": b % 10 == 0} for b in range(beacons)
+    )
+    db[config["MONGO_HEARTBEAT_COLLECTION"]].insert_many(
+        {"sniffaddr": f"sniffer{s}", "timestamp": now - 5 * n}
+        for s in range(sniffers)
+        for n in range(20)
+    )
+
+
+async def hammer(url: str, concurrency: int, duration: float):
+    latencies = []
+    errors = 0
+
+    async def client(session):
+        nonlocal errors
+        while time.perf_counter() < end:
+            start = time.perf_counter()
+            try:
+                async with session.get(url) as res:
+                    await res.read()
+                    if res.status != 200:
+                        errors += 1
+                        continue
+            except aiohttp.ClientError:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        end = time.perf_counter() + duration
+        await asyncio.gather(*(client(session) for _ in range(concurrency)))
+
+    latencies.sort()
+
+    def pct(p):
+        return latencies[min(int(len(latencies) * p), len(latencies) - 1)] * 1000
+
+    print(url)
+    if not latencies:
+        print(f"  no successful requests, {errors} errors")
+        return
+    print(
+        f"  {len(latencies) / duration:.1f} req/s, {errors} errors, "
+        f"p50 {pct(0.5):.1f} ms, p95 {pct(0.95):.1f} ms, p99 {pct(0.99):.1f} ms"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Concurrent GET load test, e.g. against app.py and asgi.py"
+    )
+    parser.add_argument("urls", nargs="*")
+    parser.add_argument("-c", "--concurrency", type=int, default=64)
+    parser.add_argument("-d", "--duration", type=float, default=10)
+    parser.add_argument(
+        "--seed",
+        type=int,
+        metavar="BEACONS",
+        help="First fill the configured database with this many beacons",
+    )
+    parser.add_argument("--sniffers", type=int, default=50)
+    args = parser.parse_args()
+
+    if args.seed:
+        seed(load_config(), args.seed, args.sniffers)
+    for url in args.urls:
+        asyncio.run(hammer(url, args.concurrency, args.duration))
@@ -0,0 +1,183 @@
+import datetime
+import math
+import mongomock
+import pytest
+from geopy.distance import geodesic
+from imagine.sharding import ZoneLeases, ZoneMap, ZoneTriangulator, server_time
+from imagine.utilities import Triangulator
+
+ZERO = [43.0, -77.0]
+N, ONE_METER_RSSI = 2, -60
+NOW = 1000.0
+
+
+def rssi(beacon, esp):
+    return ONE_METER_RSSI - 10 * N * math.log10(geodesic(beacon, esp).meters)
+
+
+@pytest.fixture
+def client():
+    return mongomock.MongoClient()
+
+
+@pytest.fixture
+def db(client):
+    return client["imagine2022"]
+
+
+def add_frames(db, beacon_id, beacon, esps):
+    for esp_id, position in esps.items():
+        db.frames.insert_one(
+            {
+                "macaddr": beacon_id,
+                "sniffaddr": esp_id,
+                "rssi": rssi(beacon, position),
+                "timestamp": NOW,
+            }
+        )
+
+
+def test_grid_zones():
+    zone_map = ZoneMap(
+        [
+            {"id": "a", "position": [43.0001, -77.0001]},
+            {"id": "b", "position": [43.0002, -77.0002]},
+            {"id": "c", "position": [43.0030, -77.0030]},
+        ],
+        ZERO,
+        250,
+    )
+    assert {z: zone.esps for z, zone in zone_map.zones.items()} == {
+        "0,-1": {"a", "b"},
+        "1,-1": {"c"},
+    }
+    # Origin is the south-west corner of the cell
+    x, y = zone_map.normalize(*zone_map.zones["1,-1"].origin)
+    assert x == pytest.approx(250)
+    assert y == pytest.approx(-250)
+
+
+def test_explicit_zone_origin():
+    zone_map = ZoneMap(
+        [
+            {"id": "a", "position": [43.0002, -77.0001], "zone": "hall"},
+            {"id": "b", "position": [43.0001, -77.0003], "zone": "hall"},
+        ],
+        ZERO,
+        250,
+    )
+    assert list(zone_map.zones) == ["hall"]
+    assert zone_map.zones["hall"].origin == [43.0001, -77.0003]
+
+
+def test_owner_is_strongest_esp():
+    zone_map = ZoneMap(
+        [
+            {"id": "a", "position": [43.0001, -77.0001], "zone": "west"},
+            {"id": "b", "position": [43.0001, -77.0002], "zone": "east"},
+        ],
+        ZERO,
+        250,
+    )
+    assert zone_map.owner({"a": {"rssi": -70}, "b": {"rssi": -65}}) == "east"
+    # Ties go to the lowest zone id, whatever order the ESPs come in
+    assert zone_map.owner({"a": {"rssi": -65}, "b": {"rssi": -65}}) == "east"
+    assert zone_map.owner({"b": {"rssi": -65}, "a": {"rssi": -65}}) == "east"
+
+
+def rebalance_rounds(leases, zone_ids, now, rounds=2):
+    for _ in range(rounds):
+        claimed = {l.worker_id: l.rebalance(zone_ids, now) for l in leases}
+    return claimed
+
+
+def assert_partition(claimed, zone_ids):
+    held = [z for zones in claimed.values() for z in zones]
+    assert sorted(held) == sorted(zone_ids)
+
+
+def test_leases_partition_zones_as_workers_join_and_die(db):
+    zone_ids = [f"{r},{c}" for r in range(2) for c in range(3)]
+    ttl = 15
+    w1, w2, w3 = (ZoneLeases(db.leases, w, ttl) for w in ("w1", "w2", "w3"))
+
+    claimed = rebalance_rounds([w1], zone_ids, NOW)
+    assert_partition(claimed, zone_ids)
+
+    claimed = rebalance_rounds([w1, w2, w3], zone_ids, NOW + 1)
+    assert_partition(claimed, zone_ids)
+    assert all(len(zones) == 2 for zones in claimed.values())
+
+    # w3 stops renewing, its zones are picked up once the lease expires
+    claimed = rebalance_rounds([w1, w2], zone_ids, NOW + 1 + ttl + 1)
+    assert_partition(claimed, zone_ids)
+    assert all(len(zones) == 3 for zones in claimed.values())
+
+
+def test_unexpired_lease_is_not_taken(db):
+    w1, w2 = ZoneLeases(db.leases, "w1", 15), ZoneLeases(db.leases, "w2", 15)
+    assert w1.claim("0,0", NOW)
+    assert not w2.claim("0,0", NOW + 10)
+    assert w2.claim("0,0", NOW + 16)
+
+
+def test_server_time_uses_server_clock():
+    class Database:
+        def command(self, name):
+            assert name == "hello"
+            # pymongo returns naive UTC datetimes
+            return {"localTime": datetime.datetime(2022, 4, 23, 12, 0, 0)}
+
+    assert server_time(Database()) == 1650715200.0
+
+
+def test_boundary_beacon_matches_unsharded(client, db):
+    esps = {
+        "a": [43.0001, -77.0001],
+        "b": [43.0001, -77.0004],
+        "c": [43.0004, -77.0001],
+        "d": [43.0006, -77.0001],
+    }
+    for esp_id, position in esps.items():
+        db.esps.insert_one(
+            {"id": esp_id, "position": position, "zone": "north" if esp_id == "d" else None}
+        )
+    add_frames(db, "beacon", [43.0003, -77.0002], esps)
+
+    zone_map = ZoneMap(db.esps.find(), ZERO, 250)
+    results = {
+        z: ZoneTriangulator(
+            zone, zone_map, N, ONE_METER_RSSI, mongo_client=client
+        ).aggregate(NOW)
+        for z, zone in zone_map.zones.items()
+    }
+    owners = [z for z, beacons in results.items() if "beacon" in beacons]
+    assert owners == ["0,-1"]
+
+    sharded = results["0,-1"]["beacon"]
+    unsharded = Triangulator(N, ONE_METER_RSSI, ZERO, mongo_client=client).aggregate(
+        NOW
+    )["beacon"]
+    assert sharded["zone"] == "0,-1"
+    assert sharded["position"] == pytest.approx(unsharded["position"])
+    assert sharded["absolute_position"] == pytest.approx(unsharded["absolute_position"])
+
+
+def test_aggregate_skips_unsolvable_beacons(client, db):
+    esps = {
+        "a": [43.0001, -77.0001],
+        "b": [43.0001, -77.0010],
+        "c": [43.0010, -77.0001],
+    }
+    for esp_id, position in esps.items():
+        db.esps.insert_one({"id": esp_id, "position": position})
+        db.frames.insert_one(
+            {"macaddr": "beacon", "sniffaddr": esp_id, "rssi": -30, "timestamp": NOW}
+        )
+
+    zone_map = ZoneMap(db.esps.find(), ZERO, 250)
+    (zone,) = zone_map.zones.values()
+    triangulator = ZoneTriangulator(
+        zone, zone_map, N, ONE_METER_RSSI, mongo_client=client
+    )
+    assert triangulator.aggregate(NOW) == {}
@@ -0,0 +1,61 @@
+import math
+import mongomock
+from geopy.distance import geodesic
+from imagine.utilities import Triangulator
+
+ZERO = [43.0, -77.0]
+N, ONE_METER_RSSI = 2, -60
+NOW = 1000.0
+BEACON = [43.0003, -77.0002]
+
+
+def add_frame(db, esp_id, position, beacon_id="beacon"):
+    distance = geodesic(BEACON, position).meters
+    db.frames.insert_one(
+        {
+            "macaddr": beacon_id,
+            "sniffaddr": esp_id,
+            "rssi": ONE_METER_RSSI - 10 * N * math.log10(distance),
+            "timestamp": NOW,
+        }
+    )
+
+
+def test_sees_esps_added_by_another_process():
+    client = mongomock.MongoClient()
+    db = client["imagine2022"]
+    esps = {
+        "a": [43.0001, -77.0001],
+        "b": [43.0001, -77.0004],
+        "c": [43.0004, -77.0001],
+    }
+    for esp_id, position in esps.items():
+        db.esps.insert_one({"id": esp_id, "position": position})
+    triangulator = Triangulator(N, ONE_METER_RSSI, ZERO, mongo_client=client)
+    assert set(triangulator.esps) == {"a", "b", "c"}  # Warms the ESP map
+
+    # Written straight to the collection, as the ASGI app or a second WSGI worker does
+    db.esps.insert_one({"id": "new", "position": [43.0006, -77.0001]})
+    for esp_id, position in esps.items():
+        add_frame(db, esp_id, position)
+    add_frame(db, "new", [43.0006, -77.0001])
+
+    beacons = triangulator.aggregate(NOW)
+    assert set(beacons["beacon"]["esps"]) == {"a", "b", "c", "new"}
+
+
+def test_skips_unregistered_sniffers():
+    client = mongomock.MongoClient()
+    db = client["imagine2022"]
+    esps = {
+        "a": [43.0001, -77.0001],
+        "b": [43.0001, -77.0004],
+        "c": [43.0004, -77.0001],
+    }
+    for esp_id, position in esps.items():
+        db.esps.insert_one({"id": esp_id, "position": position})
+        add_frame(db, esp_id, position)
+    add_frame(db, "unknown", [43.0006, -77.0001])
+
+    beacons = Triangulator(N, ONE_METER_RSSI, ZERO, mongo_client=client).aggregate(NOW)
+    assert set(beacons["beacon"]["esps"]) == {"a", "b", "c"}
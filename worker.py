@@ -0,0 +1,164 @@
+import argparse
+import logging
+import math
+import os
+import random
+import socket
+import threading
+import time
+from geopy.distance import geodesic
+from imagine import load_config
+from imagine.utilities import get_mongo_client, meters_per_degree
+from imagine.sharding import ZoneLeases, ZoneMap, ZoneTriangulator, server_time
+
+
+def run_worker(config, mongo, worker_id: str, period: float = 5, bounds: float = 2.5):
+    db = mongo[config["MONGO_DB"]]
+    zero_zero = [float(i) for i in config["TRIANGULATION_ZERO"].split(",")]
+    leases = ZoneLeases(
+        db[config.get("MONGO_LEASE_COLLECTION", "leases")], worker_id, ttl=3 * period
+    )
+    _ovr = os.environ.get("TRIANGULATION_TIMESTAMP_OVERRIDE", default="no")
+    time_override = float(_ovr) if _ovr != "no" else False
+    triangulators = {}
+    while True:
+        started = time.time()
+        try:
+            now = server_time(db)
+            zone_map = ZoneMap(
+                db[config["MONGO_ESP_COLLECTION"]].find(filter={}),
+                zero_zero,
+                float(config.get("TRIANGULATION_ZONE_SIZE", 250)),
+            )
+            claimed = leases.rebalance(list(zone_map.zones), now)
+            # Every worker triangulates the same window, taken from the
+            # server's clock, so boundary handoff agrees across nodes
+            timestamp = time_override if time_override else (now // period) * period - bounds
+        except:
+            logging.exception("Error in zone rebalance")
+            claimed = []
+        for zone_id in claimed:
+            try:
+                zone = zone_map.zones[zone_id]
+                t = triangulators.get(zone_id)
+                if t is None or t.zone != zone:
+                    t = triangulators[zone_id] = ZoneTriangulator(
+                        zone,
+                        zone_map,
+                        float(config["TRIANGULATION_ENV_FACTOR"]),
+                        float(config["TRIANGULATION_ONE_METER_RSSI"]),
+                        mongo_client=mongo,
+                        mongo_database=config["MONGO_DB"],
+                        mongo_frames_collection=config["MONGO_FRAMES_COLLECTION"],
+                        mongo_esp_collection=config["MONGO_ESP_COLLECTION"],
+                        mongo_output_collection=config["MONGO_OUTPUT_COLLECTION"],
+                    )
+                t.zone_map = zone_map
+                t.esps = zone_map.positions
+                t.run_once(timestamp, bounds=bounds)
+            except:
+                logging.exception("Error in triangulation of zone %s", zone_id)
+        logging.info("%s: zones %s", worker_id, sorted(claimed))
+        time.sleep(max(period - (time.time() - started), 0))
+
+
+def simulate(config, mongo, beacons: int, zones: int = 2, period: float = 1):
+    ''' Seed a zones x zones grid of fake ESPs, then keep inserting frames
+        for beacons wandering across it, so workers have something to shard
+        when running against mongomock://
+    '''
+    db = mongo[config["MONGO_DB"]]
+    zero_zero = [float(i) for i in config["TRIANGULATION_ZERO"].split(",")]
+    size = float(config.get("TRIANGULATION_ZONE_SIZE", 250))
+    lat_con, lon_con = meters_per_degree(zero_zero)
+    N = float(config["TRIANGULATION_ENV_FACTOR"])
+    one_meter_rssi = float(config["TRIANGULATION_ONE_METER_RSSI"])
+
+    def to_lat_lon(x, y):
+        return [zero_zero[0] + x / lat_con, zero_zero[1] + y / lon_con]
+
+    # Four ESPs inside each grid cell
+    esps = {}
+    for row in range(zones):
+        for col in range(zones):
+            for dx, dy in ((0.25, 0.25), (0.25, 0.75), (0.75, 0.25), (0.75, 0.75)):
+                esps[f"sim-esp{len(esps)}"] = to_lat_lon(
+                    (row + dx) * size, (col + dy) * size
+                )
+    db[config["MONGO_ESP_COLLECTION"]].insert_many(
+        {"id": i, "position": p} for i, p in esps.items()
+    )
+
+    positions = [
+        [random.uniform(0, zones * size), random.uniform(0, zones * size)]
+        for _ in range(beacons)
+    ]
+    while True:
+        now = time.time()
+        frames = []
+        for b, pos in enumerate(positions):
+            pos[0] = min(max(pos[0] + random.uniform(-5, 5), 0), zones * size)
+            pos[1] = min(max(pos[1] + random.uniform(-5, 5), 0), zones * size)
+            for esp_id, esp_pos in esps.items():
+                distance = max(geodesic(to_lat_lon(*pos), esp_pos).meters, 0.5)
+                if distance < 0.75 * size:
+                    frames.append(
+                        {
+                            "macaddr": f"sim-beacon{b}",
+                            "sniffaddr": esp_id,
+                            "rssi": one_meter_rssi - 10 * N * math.log10(distance),
+                            "timestamp": now,
+                        }
+                    )
+        frames_collection = db[config["MONGO_FRAMES_COLLECTION"]]
+        frames_collection.insert_many(frames)
+        frames_collection.delete_many({"timestamp": {"$lt": now - 60}})
+        time.sleep(period)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Triangulation zone worker")
+    parser.add_argument("--id", default=f"{socket.gethostname()}-{os.getpid()}")
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=1,
+        help="Workers to run in this process, sharing one Mongo client",
+    )
+    parser.add_argument("--period", type=float, default=5)
+    parser.add_argument(
+        "--simulate",
+        type=int,
+        metavar="BEACONS",
+        help="Seed fake ESPs and stream frames for this many beacons",
+    )
+    parser.add_argument(
+        "--simulate-zones",
+        type=int,
+        default=2,
+        help="Simulated grid is this many zones on each side",
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    config = load_config()
+    mongo = get_mongo_client(
+        config["MONGO_HOST"],
+        config["MONGO_DB"],
+        config["MONGO_USER"],
+        config["MONGO_PASS"],
+        config["MONGO_SSL"],
+    )
+    if args.simulate:
+        threading.Thread(
+            target=simulate,
+            args=(config, mongo, args.simulate, args.simulate_zones),
+            daemon=True,
+        ).start()
+    for n in range(1, args.threads):
+        threading.Thread(
+            target=run_worker,
+            args=(config, mongo, f"{args.id}-{n}", args.period),
+            daemon=True,
+        ).start()
+    run_worker(config, mongo, f"{args.id}-0" if args.threads > 1 else args.id, args.period)